@@ -4,6 +4,8 @@ from pydub.silence import detect_leading_silence
 from pydub.effects import speedup
 # python3 -m pip install pygame
 import pygame
+# python3 -m pip install numpy
+import numpy as np
 import logging as log
 log.basicConfig(format="[%(asctime)s] [%(filename)s/%(levelname)s]: %(message)s (Line: %(lineno)s)",
                     datefmt="%H:%M:%S",
@@ -35,6 +37,53 @@ def strip_silence(audio: AudioSegment) -> AudioSegment:
 
 ####################################################################################
 
+# OVERLAY SFX ONTO SPEECH
+# sfx_track is a list of (offset_seconds, sfx_audio, gain_db). Every clip is summed into the speech in one vectorised pass.
+def overlay_sfx(speech: AudioSegment, sfx_track: list) -> AudioSegment:
+    if not sfx_track:
+        return speech
+
+    # Match every clip to the same format (same rule pydub uses when concatenating: highest of each wins)
+    segments = [segment for segment in [speech] + [sfx for _, sfx, _ in sfx_track] if len(segment.raw_data) > 0]
+    if not segments:
+        return speech
+    frame_rate = max(segment.frame_rate for segment in segments)
+    channels = max(segment.channels for segment in segments)
+    sample_width = max(segment.sample_width for segment in segments)
+
+    def conform(audio: AudioSegment) -> AudioSegment:
+        return audio.set_frame_rate(frame_rate).set_channels(channels).set_sample_width(sample_width)
+
+    speech = conform(speech)
+    speech_samples = np.array(speech.get_array_of_samples())
+    dtype = speech_samples.dtype
+
+    # Flatten the whole SFX track into one list of sample positions and one list of (gained) sample values
+    positions = []
+    values = []
+    for offset_seconds, sfx, gain_db in sfx_track:
+        sfx_samples = np.array(conform(sfx).get_array_of_samples(), dtype=np.float64)
+        start = int(round(offset_seconds * frame_rate)) * channels # samples are interleaved, so frames -> samples
+        positions.append(np.arange(start, start + len(sfx_samples)))
+        values.append(sfx_samples * 10 ** (gain_db / 20))
+    positions = np.concatenate(positions)
+    values = np.concatenate(values)
+
+    # Output is long enough for SFX that run past the end of the speech
+    total_samples = max(len(speech_samples), int(positions.max()) + 1 if len(positions) else 0)
+
+    mixed = np.zeros(total_samples, dtype=np.float64)
+    mixed[:len(speech_samples)] = speech_samples
+    mixed += np.bincount(positions, weights=values, minlength=total_samples)
+
+    # Clipping protection
+    limits = np.iinfo(dtype)
+    mixed = np.clip(np.rint(mixed), limits.min, limits.max).astype(dtype)
+
+    return speech._spawn(mixed.tobytes())
+
+####################################################################################
+
 class VoiceSynthesiser:
     # Initialiser
     def __init__(self, settings_json_path=None, voice_path=None, sfx_path=None):
@@ -68,7 +117,17 @@ class VoiceSynthesiser:
         self.SFX_ENABLED = settings.get('sfx_enabled', False)
 
         if self.SFX_ENABLED:
-            self.SFX_DICT = dict(zip(settings['characters_that_play_sfx'], settings['sfx_file_for_characters_to_use']))
+            sfx_chars = settings['characters_that_play_sfx']
+            self.SFX_DICT = dict(zip(sfx_chars, settings['sfx_file_for_characters_to_use']))
+            # Optional per-SFX settings, same order as characters_that_play_sfx. Missing entries fall back to the defaults.
+            sfx_gains = settings.get('sfx_gain_db', [])
+            sfx_overlays = settings.get('sfx_overlay_instead_of_inline', [])
+            self.SFX_GAIN_DB = {char: (sfx_gains[i] if i < len(sfx_gains) else 0) for i, char in enumerate(sfx_chars)}
+            self.SFX_OVERLAY = {char: (sfx_overlays[i] if i < len(sfx_overlays) else False) for i, char in enumerate(sfx_chars)}
+        else:
+            self.SFX_DICT = {}
+            self.SFX_GAIN_DB = {}
+            self.SFX_OVERLAY = {}
 
         self.HIDE_VOWEL_TILDES = settings.get('hide_tildes_denoting_long_vowels_in_text_output', True)
     
@@ -408,6 +467,8 @@ class VoiceSynthesiser:
         USE_PKL = self.USE_PKL
         SFX_ENABLED = self.SFX_ENABLED
         SFX_DICT = self.SFX_DICT
+        SFX_GAIN_DB = self.SFX_GAIN_DB
+        SFX_OVERLAY = self.SFX_OVERLAY
         HIDE_VOWEL_TILDES = self.HIDE_VOWEL_TILDES
 
         log.info('Generating audio file.')
@@ -418,6 +479,7 @@ class VoiceSynthesiser:
         
         sound_dict = self.sound_dict
         output_audio = AudioSegment.empty()
+        sfx_track = [] # (offset_seconds, sfx_audio, gain_db) for SFX mixed over the speech instead of inline
 
         input_chars = list(input_string)
         input_chars_lowercase = list(input_string.lower())
@@ -497,6 +559,17 @@ class VoiceSynthesiser:
                         sound = sound_dict[char_lowercase]
                         skip = 0
 
+                # Overlaid SFX (doesn't take up any time in the speech)
+                elif SFX_ENABLED and char_lowercase in SFX_DICT and SFX_OVERLAY[char_lowercase]:
+                    output_text += char_output
+                    sfx_track.append( (output_audio.duration_seconds, sound_dict[char_lowercase], SFX_GAIN_DB[char_lowercase]) )
+                    sound = AudioSegment.silent(duration=0)
+
+                # Inline SFX
+                elif SFX_ENABLED and char_lowercase in SFX_DICT:
+                    output_text += char_output
+                    sound = sound_dict[char_lowercase].apply_gain(SFX_GAIN_DB[char_lowercase])
+
                 # Graphemes (alphabet)
                 else:
                     output_text += char_output
@@ -523,6 +596,11 @@ class VoiceSynthesiser:
 
             live_playback_text_concatenated.append(output_text)
         
+        # Mix overlaid SFX
+        if sfx_track:
+            log.info(f'Mixing {len(sfx_track)} SFX over the speech.')
+            output_audio = overlay_sfx(output_audio, sfx_track)
+
         # Export
         if PLAYBACK_SPEED != 1:
             output_audio = speedup(output_audio, playback_speed=PLAYBACK_SPEED)